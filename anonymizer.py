@@ -3,24 +3,69 @@ Anonymization Module
 Handles data encryption, decryption, and masking for privacy protection
 """
 import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
+import pandas as pd
 import streamlit as st
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Fernet cipher
-def get_cipher():
-    """Get Fernet cipher instance with encryption key"""
-    key = None
-    
-    # Try to get key from Streamlit secrets first (for cloud deployment)
+# Batch size from which decrypt_many spreads work over a thread pool
+PARALLEL_DECRYPT_THRESHOLD = 512
+
+# Anonymized field values, keyed by transform and patient_id (LRU order)
+ANONYMIZED_VIEW_CACHE_SIZE = 4096
+_ANONYMIZED_VIEW_CACHE = OrderedDict()
+_ANONYMIZED_VIEW_LOCK = threading.Lock()
+
+# Column order of patient records returned by the database layer
+PATIENT_COLUMNS = ['patient_id', 'name', 'contact', 'diagnosis', 'date_added']
+
+# Diagnosis categories in priority order, keyed by regex group name
+_DIAGNOSIS_CATEGORIES = [
+    ('respiratory', "Respiratory Condition"),
+    ('metabolic', "Metabolic Condition"),
+    ('cardiovascular', "Cardiovascular Condition"),
+    ('injury', "Injury/Trauma"),
+]
+# Word stems, so "diabetic", "fractured" or "injuries" are categorized too
+_DIAGNOSIS_KEYWORDS_RE = re.compile(
+    r"(?P<respiratory>fever|flu|cold|cough)"
+    r"|(?P<metabolic>diabet|sugar|insulin)"
+    r"|(?P<cardiovascular>heart|cardiac|blood pressure)"
+    r"|(?P<injury>fractur|injur|wound)",
+    re.IGNORECASE
+)
+
+
+@lru_cache(maxsize=1)
+def _get_secrets_key():
+    """Read ENCRYPTION_KEY from Streamlit secrets once per process"""
     try:
         if hasattr(st, 'secrets') and 'ENCRYPTION_KEY' in st.secrets:
-            key = st.secrets['ENCRYPTION_KEY']
+            return st.secrets['ENCRYPTION_KEY']
     except:
         pass
+    return None
+
+
+@lru_cache(maxsize=4)
+def _build_cipher(key: bytes) -> Fernet:
+    """Construct the Fernet cipher for a key (key parsing happens once per key)"""
+    return Fernet(key)
+
+
+# Initialize Fernet cipher
+def get_cipher():
+    """Get Fernet cipher instance with encryption key"""
+    # Try to get key from Streamlit secrets first (for cloud deployment)
+    key = _get_secrets_key()
     
     # If not in secrets, try environment variable
     if not key:
@@ -33,7 +78,7 @@ def get_cipher():
     if isinstance(key, str):
         key = key.encode()
     
-    return Fernet(key)
+    return _build_cipher(key)
 
 
 def encrypt_data(data: str) -> str:
@@ -54,6 +99,23 @@ def encrypt_data(data: str) -> str:
     return encrypted.decode()
 
 
+def encrypt_many(values: list) -> list:
+    """
+    Encrypt a batch of values with a single cipher lookup
+    
+    Args:
+        values: List of plain text values
+        
+    Returns:
+        List of encrypted data strings, in the same order
+    """
+    if not any(values):
+        return [""] * len(values)
+    
+    cipher = get_cipher()
+    return [cipher.encrypt(value.encode()).decode() if value else "" for value in values]
+
+
 def decrypt_data(encrypted_data: str) -> str:
     """
     Decrypt data using Fernet symmetric encryption
@@ -75,6 +137,49 @@ def decrypt_data(encrypted_data: str) -> str:
         return "[Decryption Error]"
 
 
+def _decrypt_tokens(cipher: Fernet, encrypted_values: list) -> list:
+    """Decrypt values with an already-built cipher, one result per value"""
+    decrypted = []
+    for token in [value.encode() if value else None for value in encrypted_values]:
+        if token is None:
+            decrypted.append("")
+            continue
+        try:
+            decrypted.append(cipher.decrypt(token).decode())
+        except Exception:
+            decrypted.append("[Decryption Error]")
+    return decrypted
+
+
+def decrypt_many(encrypted_values: list) -> list:
+    """
+    Decrypt a batch of values with a single cipher lookup
+    
+    Batches of PARALLEL_DECRYPT_THRESHOLD values or more are split into
+    chunks and decrypted on a thread pool, overlapping the OpenSSL work.
+    
+    Args:
+        encrypted_values: List of encrypted data strings
+        
+    Returns:
+        List of decrypted plain text values, in the same order
+    """
+    try:
+        cipher = get_cipher()
+    except ValueError:
+        return ["" if not value else "[Decryption Error]" for value in encrypted_values]
+    
+    workers = min(8, os.cpu_count() or 1)
+    if len(encrypted_values) < PARALLEL_DECRYPT_THRESHOLD or workers < 2:
+        return _decrypt_tokens(cipher, encrypted_values)
+    
+    chunk_size = -(-len(encrypted_values) // workers)
+    chunks = [encrypted_values[i:i + chunk_size] for i in range(0, len(encrypted_values), chunk_size)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(partial(_decrypt_tokens, cipher), chunks)
+        return [value for chunk in results for value in chunk]
+
+
 def anonymize_name(patient_id: int) -> str:
     """
     Anonymize patient name
@@ -98,13 +203,10 @@ def anonymize_contact(contact: str) -> str:
     Returns:
         Masked contact in format XXX-XXX-{last4}
     """
-    if not contact or len(contact) < 4:
-        return "XXX-XXX-XXXX"
-    
-    last_four = contact[-4:]
-    return f"XXX-XXX-{last_four}"
+    return "XXX-XXX-XXXX" if not contact or len(contact) < 4 else "XXX-XXX-" + contact[-4:]
 
 
+@lru_cache(maxsize=1024)
 def anonymize_diagnosis(diagnosis: str) -> str:
     """
     Anonymize diagnosis to generic category
@@ -118,19 +220,102 @@ def anonymize_diagnosis(diagnosis: str) -> str:
     if not diagnosis:
         return "[Restricted]"
     
-    # Simple categorization based on keywords
-    diagnosis_lower = diagnosis.lower()
+    # Single scan over the text; categories keep their priority order
+    found = {match.lastgroup for match in _DIAGNOSIS_KEYWORDS_RE.finditer(diagnosis)}
+    for group, category in _DIAGNOSIS_CATEGORIES:
+        if group in found:
+            return category
+    return "General Medical Condition"
+
+
+def _decrypted_field(patients: list, field: str) -> list:
+    """Decrypt one encrypted field across all patients in a single batch"""
+    return decrypt_many([p[field] for p in patients])
+
+
+def _anonymized_names(patients: list) -> list:
+    return [anonymize_name(p['patient_id']) for p in patients]
+
+
+def _masked_contacts(patients: list) -> list:
+    return [anonymize_contact(contact) for contact in _decrypted_field(patients, 'contact')]
+
+
+def _diagnosis_categories(patients: list) -> list:
+    return [anonymize_diagnosis(diagnosis) for diagnosis in _decrypted_field(patients, 'diagnosis')]
+
+
+def _restricted(patients: list) -> list:
+    return ["[Restricted]"] * len(patients)
+
+
+def _cached_by_ciphertext(transform, field: str):
+    """
+    Wrap a column transform so each row's result is cached per patient
     
-    if any(word in diagnosis_lower for word in ['fever', 'flu', 'cold', 'cough']):
-        return "Respiratory Condition"
-    elif any(word in diagnosis_lower for word in ['diabetes', 'sugar', 'insulin']):
-        return "Metabolic Condition"
-    elif any(word in diagnosis_lower for word in ['heart', 'cardiac', 'blood pressure']):
-        return "Cardiovascular Condition"
-    elif any(word in diagnosis_lower for word in ['fracture', 'injury', 'wound']):
-        return "Injury/Trauma"
-    else:
-        return "General Medical Condition"
+    An entry holds the field ciphertext it was computed from. Any update
+    re-encrypts the field with a fresh IV, so an edited row misses and its
+    entry is overwritten; only new or edited rows are decrypted. The cache
+    always has room for every row of the current render (two transforms
+    share it) and evicts least recently used entries beyond that.
+    """
+    def apply(patients: list) -> list:
+        keys = [(transform, p['patient_id']) for p in patients]
+        values = [None] * len(patients)
+        missing = []
+        
+        with _ANONYMIZED_VIEW_LOCK:
+            for i, (key, patient) in enumerate(zip(keys, patients)):
+                entry = _ANONYMIZED_VIEW_CACHE.get(key)
+                if entry is not None and entry[0] == patient[field]:
+                    _ANONYMIZED_VIEW_CACHE.move_to_end(key)
+                    values[i] = entry[1]
+                else:
+                    missing.append(i)
+        
+        if missing:
+            computed = transform([patients[i] for i in missing])
+            with _ANONYMIZED_VIEW_LOCK:
+                for i, value in zip(missing, computed):
+                    values[i] = value
+                    _ANONYMIZED_VIEW_CACHE[keys[i]] = (patients[i][field], value)
+                    _ANONYMIZED_VIEW_CACHE.move_to_end(keys[i])
+                capacity = max(ANONYMIZED_VIEW_CACHE_SIZE, 2 * len(patients))
+                while len(_ANONYMIZED_VIEW_CACHE) > capacity:
+                    _ANONYMIZED_VIEW_CACHE.popitem(last=False)
+        
+        return values
+    return apply
+
+
+_cached_masked_contacts = _cached_by_ciphertext(_masked_contacts, 'contact')
+_cached_diagnosis_categories = _cached_by_ciphertext(_diagnosis_categories, 'diagnosis')
+
+# Per-role (name, contact, diagnosis) column transforms; unknown roles get
+# fully restricted data. This table is the single source of what each role
+# sees.
+_ROLE_TRANSFORMS = {
+    # Admin sees raw decrypted data
+    'admin': (
+        partial(_decrypted_field, field='name'),
+        partial(_decrypted_field, field='contact'),
+        partial(_decrypted_field, field='diagnosis')
+    ),
+    # Doctor sees anonymized name, masked contact and diagnosis category
+    'doctor': (_anonymized_names, _cached_masked_contacts, _cached_diagnosis_categories),
+    # Receptionist sees minimal anonymized data
+    'receptionist': (_anonymized_names, _cached_masked_contacts, _restricted)
+}
+_RESTRICTED_TRANSFORMS = (_restricted, _restricted, _restricted)
+
+
+def _role_columns(patients: list, role: str) -> dict:
+    """Column lists of the patient records as the role may see them"""
+    columns = {column: [p[column] for p in patients] for column in PATIENT_COLUMNS}
+    transforms = _ROLE_TRANSFORMS.get(role, _RESTRICTED_TRANSFORMS)
+    for column, transform in zip(('name', 'contact', 'diagnosis'), transforms):
+        columns[column] = transform(patients)
+    return columns
 
 
 def prepare_patient_data_for_role(patient_data: dict, role: str) -> dict:
@@ -144,39 +329,23 @@ def prepare_patient_data_for_role(patient_data: dict, role: str) -> dict:
     Returns:
         Modified patient data dictionary based on role permissions
     """
-    if role == 'admin':
-        # Admin sees raw decrypted data
-        return {
-            'patient_id': patient_data['patient_id'],
-            'name': decrypt_data(patient_data['name']),
-            'contact': decrypt_data(patient_data['contact']),
-            'diagnosis': decrypt_data(patient_data['diagnosis']),
-            'date_added': patient_data['date_added']
-        }
-    elif role == 'doctor':
-        # Doctor sees anonymized data
-        return {
-            'patient_id': patient_data['patient_id'],
-            'name': anonymize_name(patient_data['patient_id']),
-            'contact': anonymize_contact(decrypt_data(patient_data['contact'])),
-            'diagnosis': anonymize_diagnosis(decrypt_data(patient_data['diagnosis'])),
-            'date_added': patient_data['date_added']
-        }
-    elif role == 'receptionist':
-        # Receptionist sees minimal anonymized data
-        return {
-            'patient_id': patient_data['patient_id'],
-            'name': anonymize_name(patient_data['patient_id']),
-            'contact': anonymize_contact(decrypt_data(patient_data['contact'])),
-            'diagnosis': "[Restricted]",
-            'date_added': patient_data['date_added']
-        }
-    else:
-        # Unknown role - return fully restricted data
-        return {
-            'patient_id': patient_data['patient_id'],
-            'name': "[Restricted]",
-            'contact': "[Restricted]",
-            'diagnosis': "[Restricted]",
-            'date_added': patient_data['date_added']
-        }
+    columns = _role_columns([patient_data], role)
+    return {column: values[0] for column, values in columns.items()}
+
+
+def prepare_patients_frame(patients: list, role: str) -> pd.DataFrame:
+    """
+    Prepare patient records for display as a DataFrame based on user role
+    
+    The role's column transforms are looked up once, each encrypted field
+    the role needs is decrypted in one batch, and the frame is built from
+    column lists in one go.
+    
+    Args:
+        patients: List of patient dictionaries with encrypted data
+        role: User's role (admin/doctor/receptionist)
+        
+    Returns:
+        DataFrame with one row per patient, prepared for the role
+    """
+    return pd.DataFrame(_role_columns(patients, role), columns=PATIENT_COLUMNS)
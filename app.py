@@ -9,6 +9,8 @@ Implements CIA Triad:
 """
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 from datetime import datetime
 import time
 import os
@@ -17,7 +19,7 @@ import sqlite3
 # Auto-initialize database if it doesn't exist
 def ensure_database_initialized():
     """Ensure database is initialized with schema and default users"""
-    from init_db import init_database
+    from init_db import init_database, SCHEMA_VERSION
     
     if not os.path.exists('hospital.db'):
         # Database doesn't exist, create it
@@ -34,10 +36,12 @@ def ensure_database_initialized():
             if table_exists:
                 cursor.execute("SELECT COUNT(*) FROM users")
                 count = cursor.fetchone()[0]
+                cursor.execute("PRAGMA user_version")
+                schema_version = cursor.fetchone()[0]
                 conn.close()
                 
-                if count == 0:
-                    # Table exists but no users, reinitialize
+                if count == 0 or schema_version < SCHEMA_VERSION:
+                    # No users yet or older schema, (re)initialize (idempotent)
                     init_database()
             else:
                 # Table doesn't exist, initialize
@@ -54,15 +58,16 @@ ensure_database_initialized()
 # Import custom modules
 from auth import (
     initialize_session_state, is_authenticated, get_current_user,
-    hash_password, login_user, logout_user
+    login_user, logout_user
 )
 from database import (
-    authenticate_user, add_patient, get_all_patients, get_patient_by_id,
+    authenticate_user, add_patient, get_all_patients_cached,
     update_patient, delete_patient, get_patient_count, log_action,
     get_all_logs, get_logs_by_action, get_activity_stats, get_daily_activity
 )
 from anonymizer import (
-    encrypt_data, decrypt_data, prepare_patient_data_for_role
+    encrypt_many, decrypt_many, anonymize_name, anonymize_contact,
+    prepare_patients_frame
 )
 
 # Page configuration
@@ -83,6 +88,22 @@ if 'app_start_time' not in st.session_state:
 
 # ==================== UTILITY FUNCTIONS ====================
 
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """Encode a DataFrame as UTF-8 CSV bytes using Arrow's multithreaded CSV writer"""
+    sink = pa.BufferOutputStream()
+    pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), sink)
+    return sink.getvalue().to_pybytes()
+
+
+def to_chart_series(daily_activity: list) -> pd.Series:
+    """Build a date-indexed count Series for charts directly from activity rows"""
+    return pd.Series(
+        [row['count'] for row in daily_activity],
+        index=[row['date'] for row in daily_activity],
+        name='count'
+    )
+
+
 def show_login_page():
     """Display login page"""
     st.title("🏥 Hospital Management System")
@@ -103,9 +124,8 @@ def show_login_page():
                 if not username or not password:
                     st.error("❌ Please enter both username and password")
                 else:
-                    # Hash password and authenticate
-                    password_hash = hash_password(password)
-                    user_data = authenticate_user(username, password_hash)
+                    # Verify password against the stored hash
+                    user_data = authenticate_user(username, password)
                     
                     if user_data:
                         user_id, username, role = user_data
@@ -233,12 +253,12 @@ def show_dashboard_home(role: str):
         daily_activity = get_daily_activity(7)
         
         if daily_activity:
-            df = pd.DataFrame(daily_activity)
-            st.line_chart(df.set_index('date')['count'])
+            st.line_chart(to_chart_series(daily_activity))
         else:
             st.info("No activity data available yet")
 
 
+@st.fragment
 def show_patients_page(role: str):
     """Display patients list with role-based data masking"""
     st.header("👥 Patient Records")
@@ -256,25 +276,35 @@ def show_patients_page(role: str):
             st.info("🔍 **Anonymized View Mode**: You are viewing data as doctors/receptionists would see it.")
     
     # Get all patients (encrypted data)
-    patients = get_all_patients()
+    patients = get_all_patients_cached()
     
     if not patients:
         st.info("No patient records found")
         return
     
     # Prepare data based on role (or force anonymized for admin if toggled)
-    display_data = []
-    for patient in patients:
-        if role == 'admin' and view_anonymized:
-            # Show admin what doctors see (anonymized)
-            processed_patient = prepare_patient_data_for_role(patient, 'doctor')
-        else:
-            # Normal role-based view
-            processed_patient = prepare_patient_data_for_role(patient, role)
-        display_data.append(processed_patient)
+    if role == 'admin' and view_anonymized:
+        # Show admin what doctors see (anonymized)
+        view_role = 'doctor'
+    else:
+        # Normal role-based view
+        view_role = role
+    
+    # Reuse views prepared for the same rows in this session, so toggle flips
+    # don't recompute them; any added, edited or deleted row changes the key
+    patients_key = (len(patients), max(p['patient_id'] for p in patients),
+                    hash(tuple((p['patient_id'], p['name'], p['contact'], p['diagnosis']) for p in patients)))
+    prepared_views = st.session_state.get('prepared_patient_views')
+    if not prepared_views or prepared_views['key'] != patients_key:
+        prepared_views = {'key': patients_key, 'frames': {}}
+        st.session_state.prepared_patient_views = prepared_views
+    
+    df = prepared_views['frames'].get(view_role)
+    if df is None:
+        df = prepare_patients_frame(patients, view_role)
+        prepared_views['frames'][view_role] = df
     
     # Display as dataframe
-    df = pd.DataFrame(display_data)
     st.dataframe(df, use_container_width=True, hide_index=True)
     
     # Log the view action
@@ -319,9 +349,9 @@ def show_add_patient_page(user_id: int, role: str):
             else:
                 try:
                     # Encrypt sensitive data
-                    name_encrypted = encrypt_data(name)
-                    contact_encrypted = encrypt_data(contact)
-                    diagnosis_encrypted = encrypt_data(diagnosis)
+                    name_encrypted, contact_encrypted, diagnosis_encrypted = encrypt_many(
+                        [name, contact, diagnosis]
+                    )
                     
                     # Add to database
                     success = add_patient(
@@ -348,37 +378,41 @@ def show_edit_patient_page(user_id: int, role: str):
     st.header("✏️ Edit Patient Record")
     
     # Get all patients
-    patients = get_all_patients()
+    patients = get_all_patients_cached()
     
     if not patients:
         st.info("No patient records found")
         return
     
-    # Select patient to edit
-    patient_options = {f"ID {p['patient_id']} - Added {p['date_added']}": p['patient_id'] for p in patients}
+    # Select patient to edit (reuse the already-fetched row, no second query)
+    patient_options = {f"ID {p['patient_id']} - Added {p['date_added']}": p for p in patients}
     selected = st.selectbox("Select Patient to Edit", list(patient_options.keys()))
     
     if selected:
-        patient_id = patient_options[selected]
-        patient = get_patient_by_id(patient_id)
+        patient = patient_options[selected]
+        patient_id = patient['patient_id']
         
         if patient:
             st.markdown("---")
             
-            # Decrypt current data (admin sees all, receptionist sees masked)
+            # Decrypt each field once, reused for display and on submit
+            original_name, original_contact, original_diagnosis = decrypt_many(
+                [patient['name'], patient['contact'], patient['diagnosis']]
+            )
+            
+            # Current data (admin sees all, receptionist sees masked)
             if role == 'admin':
-                current_name = decrypt_data(patient['name'])
-                current_contact = decrypt_data(patient['contact'])
-                current_diagnosis = decrypt_data(patient['diagnosis'])
+                current_name = original_name
+                current_contact = original_contact
+                current_diagnosis = original_diagnosis
             else:
                 # Receptionist sees masked data but can enter new values
-                processed = prepare_patient_data_for_role(patient, role)
                 current_name = ""  # Empty so they can enter new data
                 current_contact = ""  # Empty so they can enter new data
                 current_diagnosis = "[Restricted - Cannot view or edit diagnosis]"
                 
                 # Show current masked values for reference
-                st.info(f"📋 **Current Record:** Patient: {processed['name']} | Contact: {processed['contact']}")
+                st.info(f"📋 **Current Record:** Patient: {anonymize_name(patient_id)} | Contact: {anonymize_contact(original_contact)}")
             
             with st.form("edit_patient_form"):
                 col1, col2 = st.columns(2)
@@ -398,7 +432,7 @@ def show_edit_patient_page(user_id: int, role: str):
                         diagnosis = st.text_area("Diagnosis *", value=current_diagnosis)
                     else:
                         st.text_area("Diagnosis", value=current_diagnosis, disabled=True)
-                        diagnosis = decrypt_data(patient['diagnosis'])  # Keep original
+                        diagnosis = original_diagnosis  # Keep original
                 
                 submitted = st.form_submit_button("💾 Update Patient", use_container_width=True)
                 
@@ -407,10 +441,15 @@ def show_edit_patient_page(user_id: int, role: str):
                         st.error("❌ Please fill in all required fields")
                     else:
                         try:
-                            # Encrypt data
-                            name_encrypted = encrypt_data(name)
-                            contact_encrypted = encrypt_data(contact)
-                            diagnosis_encrypted = encrypt_data(diagnosis)
+                            # Encrypt changed fields only; unchanged ones keep their ciphertext
+                            values = {'name': name, 'contact': contact, 'diagnosis': diagnosis}
+                            originals = {'name': original_name, 'contact': original_contact, 'diagnosis': original_diagnosis}
+                            changed = [field for field in values if values[field] != originals[field]]
+                            encrypted = dict(zip(changed, encrypt_many([values[field] for field in changed])))
+                            
+                            name_encrypted = encrypted.get('name', patient['name'])
+                            contact_encrypted = encrypted.get('contact', patient['contact'])
+                            diagnosis_encrypted = encrypted.get('diagnosis', patient['diagnosis'])
                             
                             # Update database
                             success = update_patient(
@@ -439,19 +478,14 @@ def show_delete_patient_page(user_id: int, role: str):
     st.warning("⚠️ **Warning**: This action cannot be undone. Patient data will be permanently deleted.")
     
     # Get all patients
-    patients = get_all_patients()
+    patients = get_all_patients_cached()
     
     if not patients:
         st.info("No patient records found")
         return
     
     # Prepare display data
-    display_data = []
-    for patient in patients:
-        processed = prepare_patient_data_for_role(patient, role)
-        display_data.append(processed)
-    
-    df = pd.DataFrame(display_data)
+    df = prepare_patients_frame(patients, role)
     st.dataframe(df, use_container_width=True, hide_index=True)
     
     st.markdown("---")
@@ -477,6 +511,7 @@ def show_delete_patient_page(user_id: int, role: str):
             st.info("Deletion cancelled")
 
 
+@st.fragment
 def show_audit_logs_page(role: str):
     """Display audit logs (admin only)"""
     st.header("📜 Integrity Audit Logs")
@@ -535,11 +570,11 @@ def show_analytics_page(role: str):
     # Activity chart
     if daily_activity:
         st.subheader("📊 Daily Activity (Last 30 Days)")
-        df = pd.DataFrame(daily_activity)
-        st.line_chart(df.set_index('date')['count'])
+        activity_series = to_chart_series(daily_activity)
+        st.line_chart(activity_series)
         
         st.subheader("📊 Activity Distribution")
-        st.bar_chart(df.set_index('date')['count'])
+        st.bar_chart(activity_series)
     else:
         st.info("No activity data available")
 
@@ -556,25 +591,17 @@ def show_export_page(user_id: int, role: str):
         st.subheader("👥 Export Patient Data")
         
         # Get patients
-        patients = get_all_patients()
+        patients = get_all_patients_cached()
         
         if patients:
-            display_data = []
-            for patient in patients:
-                processed = prepare_patient_data_for_role(patient, role)
-                # Format date_added to be more readable in CSV
-                if 'date_added' in processed and processed['date_added']:
-                    try:
-                        # Parse and reformat date for better CSV display
-                        processed['date_added'] = pd.to_datetime(processed['date_added']).strftime('%Y-%m-%d %H:%M:%S')
-                    except:
-                        pass  # Keep original if parsing fails
-                display_data.append(processed)
+            df_patients = prepare_patients_frame(patients, role)
             
-            df_patients = pd.DataFrame(display_data)
+            # Format date_added to be more readable in CSV (keep original if parsing fails)
+            formatted_dates = pd.to_datetime(df_patients['date_added'], errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S')
+            df_patients['date_added'] = formatted_dates.fillna(df_patients['date_added'])
             
             # Convert to CSV
-            csv_patients = df_patients.to_csv(index=False)
+            csv_patients = to_csv_bytes(df_patients)
             
             st.download_button(
                 label="📥 Download Patients CSV",
@@ -602,7 +629,7 @@ def show_export_page(user_id: int, role: str):
                 df_logs['timestamp'] = pd.to_datetime(df_logs['timestamp']).dt.strftime('%Y-%m-%d %H:%M:%S')
             
             # Convert to CSV
-            csv_logs = df_logs.to_csv(index=False)
+            csv_logs = to_csv_bytes(df_logs)
             
             st.download_button(
                 label="📥 Download Logs CSV",
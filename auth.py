@@ -3,26 +3,56 @@ Authentication Module
 Handles user authentication, password hashing, and session management
 """
 import hashlib
+import hmac
+from functools import lru_cache
+from argon2 import PasswordHasher, extract_parameters
+from argon2.low_level import ARGON2_VERSION
+from argon2.exceptions import InvalidHashError, VerificationError
 import streamlit as st
 
 
+# Production Argon2id cost, following the RFC 9106 second recommended option
+# (t=3 passes, 64 MiB memory, 4 lanes)
+ARGON2_TIME_COST = 3
+ARGON2_MEMORY_COST = 64 * 1024  # KiB
+ARGON2_PARALLELISM = 4
+
+
+@lru_cache(maxsize=1)
+def get_password_hasher() -> PasswordHasher:
+    """Get the process-wide Argon2id password hasher"""
+    return PasswordHasher(
+        time_cost=ARGON2_TIME_COST,
+        memory_cost=ARGON2_MEMORY_COST,
+        parallelism=ARGON2_PARALLELISM
+    )
+
+
+def _is_legacy_hash(hashed_password: str) -> bool:
+    """Check for an unsalted SHA-256 hex digest from before the Argon2 switch"""
+    return len(hashed_password) == 64 and all(c in '0123456789abcdef' for c in hashed_password)
+
+
 def hash_password(password: str) -> str:
     """
-    Hash password using SHA-256
+    Hash password using Argon2id with a random per-password salt
     
     Args:
         password: Plain text password
         
     Returns:
-        Hashed password as hexadecimal string
+        Encoded Argon2 hash (parameters and salt included)
     """
-    return hashlib.sha256(password.encode()).hexdigest()
+    return get_password_hasher().hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify password against hashed version
     
+    Argon2 hashes are verified with the salt and parameters stored in the
+    hash itself; legacy SHA-256 hex digests are still accepted.
+    
     Args:
         plain_password: Plain text password to verify
         hashed_password: Stored hashed password
@@ -30,19 +60,62 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     Returns:
         True if passwords match, False otherwise
     """
-    return hash_password(plain_password) == hashed_password
+    if not hashed_password:
+        return False
+    
+    if _is_legacy_hash(hashed_password):
+        digest = hashlib.sha256(plain_password.encode('utf-8')).hexdigest()
+        return hmac.compare_digest(digest, hashed_password)
+    
+    try:
+        return get_password_hasher().verify(hashed_password, plain_password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """
+    Check whether a stored hash should be upgraded after a successful login
+    
+    Only upgrades: an Argon2 hash is rehashed when its type or version
+    differs or any of its costs is below the current hasher's, never to
+    lower a stronger stored hash to weaker settings.
+    
+    Args:
+        hashed_password: Stored hashed password
+        
+    Returns:
+        True for legacy SHA-256 digests and Argon2 hashes weaker than current
+    """
+    if _is_legacy_hash(hashed_password):
+        return True
+    
+    stored = extract_parameters(hashed_password)
+    current = get_password_hasher()
+    return (
+        stored.type != current.type
+        or stored.version < ARGON2_VERSION
+        or stored.time_cost < current.time_cost
+        or stored.memory_cost < current.memory_cost
+        or stored.parallelism < current.parallelism
+        or stored.hash_len < current.hash_len
+        or stored.salt_len < current.salt_len
+    )
+
+
+# Session keys seeded on every rerun and restored on logout
+SESSION_DEFAULTS = {
+    'authenticated': False,
+    'user_id': None,
+    'username': None,
+    'role': None
+}
 
 
 def initialize_session_state():
     """Initialize session state variables if they don't exist"""
-    if 'authenticated' not in st.session_state:
-        st.session_state.authenticated = False
-    if 'user_id' not in st.session_state:
-        st.session_state.user_id = None
-    if 'username' not in st.session_state:
-        st.session_state.username = None
-    if 'role' not in st.session_state:
-        st.session_state.role = None
+    for key, value in SESSION_DEFAULTS.items():
+        st.session_state.setdefault(key, value)
 
 
 def login_user(user_id: int, username: str, role: str):
@@ -61,9 +134,9 @@ def login_user(user_id: int, username: str, role: str):
 
 
 def logout_user():
-    """Clear all session state on logout"""
-    for key in list(st.session_state.keys()):
-        del st.session_state[key]
+    """Clear all session state on logout and re-seed the defaults"""
+    st.session_state.clear()
+    initialize_session_state()
 
 
 def is_authenticated() -> bool:
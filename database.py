@@ -2,10 +2,119 @@
 Database Module
 Handles all database operations, logging, and data persistence
 """
+import atexit
+import logging
+import queue
 import sqlite3
-from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import streamlit as st
+from auth import hash_password, password_needs_rehash, verify_password
+
+logger = logging.getLogger(__name__)
+
+
+# ==================== SQL STATEMENTS ====================
+# Defined once so every call passes the same SQL text to the per-connection
+# prepared statement cache
+
+# The username is snapshotted into the row so log readers need no join
+_SQL_INSERT_LOG = """
+    INSERT INTO logs (user_id, username, role, action, details, timestamp)
+    VALUES (?1, (SELECT username FROM users WHERE user_id = ?1), ?2, ?3, ?4, ?5)
+"""
+
+_SQL_GET_USER_BY_USERNAME = """
+    SELECT user_id, username, role, password
+    FROM users
+    WHERE username = ?
+"""
+
+_SQL_UPDATE_USER_PASSWORD = "UPDATE users SET password = ? WHERE user_id = ?"
+
+_SQL_GET_ALL_USERS = "SELECT user_id, username, role FROM users ORDER BY user_id"
+
+_SQL_INSERT_PATIENT = """
+    INSERT INTO patients (name, contact, diagnosis)
+    VALUES (?, ?, ?)
+"""
+
+_SQL_GET_ALL_PATIENTS = """
+    SELECT patient_id, name, contact, diagnosis, date_added
+    FROM patients
+    ORDER BY patient_id DESC
+"""
+
+_SQL_GET_PATIENT_BY_ID = """
+    SELECT patient_id, name, contact, diagnosis, date_added
+    FROM patients
+    WHERE patient_id = ?
+"""
+
+_SQL_UPDATE_PATIENT = """
+    UPDATE patients
+    SET name = ?, contact = ?, diagnosis = ?
+    WHERE patient_id = ?
+"""
+
+_SQL_DELETE_PATIENT = "DELETE FROM patients WHERE patient_id = ?"
+
+# Maintained by the patients_count_* triggers created in init_db
+_SQL_COUNT_PATIENTS = "SELECT v as count FROM app_meta WHERE k = 'patient_count'"
+
+_SQL_GET_ALL_LOGS = """
+    SELECT log_id, user_id, username, role, action, timestamp, details
+    FROM logs
+    ORDER BY timestamp DESC
+    LIMIT ?
+"""
+
+_SQL_GET_LOGS_BY_USER = """
+    SELECT log_id, user_id, role, action, timestamp, details
+    FROM logs
+    WHERE user_id = ?
+    ORDER BY timestamp DESC
+    LIMIT ?
+"""
+
+_SQL_GET_LOGS_BY_ACTION = """
+    SELECT log_id, user_id, username, role, action, timestamp, details
+    FROM logs
+    WHERE action = ?
+    ORDER BY timestamp DESC
+    LIMIT ?
+"""
+
+_SQL_ACTIVITY_STATS = """
+    SELECT
+        (SELECT COUNT(*) FROM logs) as total_logs,
+        (SELECT COUNT(*) FROM logs
+         WHERE timestamp >= DATE('now')
+         AND timestamp < DATE('now', '+1 day')) as logs_today,
+        top.username,
+        top.count
+    FROM (SELECT 1)
+    LEFT JOIN (
+        SELECT username, COUNT(*) as count
+        FROM logs
+        WHERE username IS NOT NULL
+        GROUP BY user_id
+        ORDER BY count DESC
+        LIMIT 1
+    ) top ON 1
+"""
+
+_SQL_DAILY_ACTIVITY = """
+    SELECT substr(timestamp, 1, 10) as date, COUNT(*) as count
+    FROM logs
+    WHERE timestamp >= ?
+    GROUP BY date
+    ORDER BY date
+"""
 
 
 def get_db_connection():
@@ -15,81 +124,285 @@ def get_db_connection():
     Returns:
         SQLite connection object
     """
-    conn = sqlite3.connect('hospital.db', timeout=10.0, check_same_thread=False)
+    # sqlite3 keeps an LRU of prepared statements keyed by SQL text per
+    # connection; with long-lived connections every query here stays prepared
+    conn = sqlite3.connect('hospital.db', timeout=10.0, check_same_thread=False,
+                           cached_statements=256)
     conn.row_factory = sqlite3.Row  # Enable column access by name
+    
+    # WAL lets readers run alongside a writer; NORMAL sync is safe with WAL
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+    conn.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
     return conn
 
 
+class ConnectionPool:
+    """
+    Reusable SQLite connections shared across Streamlit sessions
+    
+    Each caller checks out a connection of its own, so concurrent reruns
+    don't serialize on one connection. Connections are opened lazily and
+    kept for reuse, so the pool grows to the peak number of concurrent
+    callers and never reopens a connection per query.
+    """
+    
+    def __init__(self, connect: Callable[[], sqlite3.Connection] = get_db_connection):
+        self._connect = connect
+        self._idle = queue.SimpleQueue()
+    
+    @contextmanager
+    def checkout(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for the duration of a with-block"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+
 @st.cache_resource
-def get_cached_connection():
+def get_connection_pool() -> ConnectionPool:
     """
-    Get cached database connection for better performance
-    Used with Streamlit's caching mechanism
+    Get the process-wide connection pool
+    Used with Streamlit's caching mechanism; every query in this module
+    checks out its connection from it
     """
-    return get_db_connection()
+    return ConnectionPool()
+
+
+def _rows_as_dicts(cursor: sqlite3.Cursor) -> List[Dict]:
+    """
+    Fetch all remaining rows of an executed cursor as dictionaries
+    
+    Rows are fetched as plain tuples and zipped with the column names once,
+    which is cheaper than building a sqlite3.Row per row and converting it.
+    """
+    cursor.row_factory = None
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+@lru_cache(maxsize=1)
+def _dummy_password_hash() -> str:
+    """
+    Argon2 hash verified against when a username is not found
+    
+    Built on first use with the current hasher settings, so a failed lookup
+    costs the same single Argon2 verify as a wrong password for a real user.
+    """
+    return hash_password("dummy-password-for-unknown-users")
+
+
+@lru_cache(maxsize=32)
+def _row_type(columns: Tuple[str, ...]) -> type:
+    """Namedtuple class for a set of result columns, built once per column set"""
+    return namedtuple('Row', columns)
+
+
+def _fetchone_as_namedtuple(cursor: sqlite3.Cursor) -> Optional[Tuple]:
+    """
+    Fetch the next row of an executed cursor as a namedtuple
+    
+    Used for single-row results read field by field, where attribute access
+    on a tuple is cheaper than sqlite3.Row's lookup by column name.
+    """
+    cursor.row_factory = None
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return _row_type(tuple(column[0] for column in cursor.description))._make(row)
 
 
 # ==================== LOGGING FUNCTIONS ====================
 
+def _utc_timestamp() -> str:
+    """Current UTC time in the same format as SQLite's CURRENT_TIMESTAMP"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _log_action_inline(cursor: sqlite3.Cursor, user_id: int, role: str, action: str, details: str = ""):
+    """
+    Write an audit log row inside the caller's open transaction
+    
+    Used by data-modifying functions so the change and its audit entry
+    commit together.
+    """
+    cursor.execute(_SQL_INSERT_LOG, (user_id, role, action, details, _utc_timestamp()))
+
+
+class AuditLogWriter:
+    """
+    Buffer audit log rows and write them to the database in batches
+    
+    A daemon thread flushes the buffer every `interval` seconds, or as soon
+    as `batch_size` rows are waiting, inserting the whole batch in a single
+    transaction. Log readers call flush() first so they see every action
+    logged before them, and pending rows are flushed at interpreter exit.
+    A batch that fails to write is kept and retried by the next flush.
+    """
+    
+    def __init__(self, batch_size: int = 64, interval: float = 0.1):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.SimpleQueue()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+        # Rows of a failed batch, written ahead of newer rows on the next flush
+        self._pending = []
+    
+    def submit(self, row: Tuple):
+        """Queue one (user_id, role, action, details, timestamp) row for writing"""
+        self._queue.put(row)
+        self._ensure_thread()
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+    
+    def flush(self):
+        """Write all queued rows to the database in one transaction"""
+        with self._flush_lock:
+            rows, self._pending = self._pending, []
+            while not self._queue.empty():
+                rows.append(self._queue.get_nowait())
+            
+            if not rows:
+                return
+            
+            written = False
+            try:
+                with get_connection_pool().checkout() as conn:
+                    with conn:
+                        cursor = conn.cursor()
+                        
+                        cursor.executemany(_SQL_INSERT_LOG, rows)
+                written = True
+            except sqlite3.Error:
+                logger.exception("Error logging action")
+            finally:
+                if not written:
+                    self._pending = rows
+    
+    def _ensure_thread(self):
+        """Start the background flush thread on first use"""
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                    self._thread.start()
+    
+    def _run(self):
+        """Background loop flushing the queue periodically"""
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            # Keep the thread alive; failed rows stay pending for the next pass
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Error flushing audit log")
+
+
+_audit_log_writer = AuditLogWriter()
+atexit.register(_audit_log_writer.flush)
+
+
 def log_action(user_id: int, role: str, action: str, details: str = ""):
     """
     Log user action to audit trail
     
+    The row is queued and written by the batched audit log writer, so the
+    caller does not wait for the insert and commit.
+    
     Args:
         user_id: User's database ID
         role: User's role
         action: Action type (login, view, add, update, delete, export, etc.)
         details: Additional details about the action (no sensitive data)
     """
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO logs (user_id, role, action, details)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, role, action, details))
-        
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Error logging action: {e}")
+    # Stamp the row now, not at flush time
+    _audit_log_writer.submit((user_id, role, action, details, _utc_timestamp()))
+
+
+def flush_audit_log():
+    """Write any queued audit log rows to the database now"""
+    _audit_log_writer.flush()
 
 
 # ==================== USER FUNCTIONS ====================
 
-def authenticate_user(username: str, password_hash: str) -> Optional[Tuple[int, str, str]]:
+def authenticate_user(username: str, password: str) -> Optional[Tuple[int, str, str]]:
     """
-    Authenticate user with username and hashed password
+    Authenticate user with username and password
+    
+    The stored hash is looked up by username and the password is verified
+    against it here, so hashing works from the stored value (and any salt
+    it carries) instead of a hash computed up front by the caller.
     
     Args:
         username: Username
-        password_hash: SHA-256 hashed password
+        password: Plain text password
         
     Returns:
         Tuple of (user_id, username, role) if successful, None otherwise
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT user_id, username, role
-            FROM users
-            WHERE username = ? AND password = ?
-        """, (username, password_hash))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return (result['user_id'], result['username'], result['role'])
+        with get_connection_pool().checkout() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(_SQL_GET_USER_BY_USERNAME, (username,))
+            
+            result = _fetchone_as_namedtuple(cursor)
+        
+        # Verify after returning the connection; Argon2 is deliberately slow
+        if result is None:
+            # Still pay for one verify so response time doesn't reveal
+            # whether the username exists
+            verify_password(password, _dummy_password_hash())
+            return None
+        
+        if verify_password(password, result.password):
+            # Transparently upgrade legacy SHA-256 or outdated Argon2 hashes
+            if password_needs_rehash(result.password):
+                update_user_password(result.user_id, hash_password(password))
+            return (result.user_id, result.username, result.role)
         return None
-    except Exception as e:
-        print(f"Error authenticating user: {e}")
+    except sqlite3.Error:
+        logger.exception("Error authenticating user")
         return None
 
 
+def update_user_password(user_id: int, password_hash: str) -> bool:
+    """
+    Replace a user's stored password hash
+    
+    Args:
+        user_id: User's database ID
+        password_hash: New encoded password hash
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    try:
+        with get_connection_pool().checkout() as conn:
+            with conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(_SQL_UPDATE_USER_PASSWORD, (password_hash, user_id))
+            
+            return True
+    except sqlite3.Error:
+        logger.exception("Error updating password")
+        return False
+
+
 def get_all_users() -> List[Dict]:
     """
     Get all users (admin only)
@@ -98,16 +411,15 @@ def get_all_users() -> List[Dict]:
         List of user dictionaries
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT user_id, username, role FROM users ORDER BY user_id")
-        users = [dict(row) for row in cursor.fetchall()]
-        
-        conn.close()
-        return users
-    except Exception as e:
-        print(f"Error fetching users: {e}")
+        with get_connection_pool().checkout() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(_SQL_GET_ALL_USERS)
+            users = _rows_as_dicts(cursor)
+            
+            return users
+    except sqlite3.Error:
+        logger.exception("Error fetching users")
         return []
 
 
@@ -129,24 +441,52 @@ def add_patient(name_encrypted: str, contact_encrypted: str, diagnosis_encrypted
         True if successful, False otherwise
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO patients (name, contact, diagnosis)
-            VALUES (?, ?, ?)
-        """, (name_encrypted, contact_encrypted, diagnosis_encrypted))
-        
-        patient_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        # Log the action
-        log_action(user_id, role, "ADD_PATIENT", f"Added patient ID: {patient_id}")
+        with get_connection_pool().checkout() as conn:
+            with conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(_SQL_INSERT_PATIENT, (name_encrypted, contact_encrypted, diagnosis_encrypted))
+                
+                patient_id = cursor.lastrowid
+                
+                # Log the action in the same transaction
+                _log_action_inline(cursor, user_id, role, "ADD_PATIENT", f"Added patient ID: {patient_id}")
+            
+            get_all_patients_cached.clear()
+            
+            return True
+    except sqlite3.Error:
+        logger.exception("Error adding patient")
+        return False
+
+
+def bulk_add_patients(patients: List[Tuple[str, str, str]], user_id: int, role: str) -> bool:
+    """
+    Add many patient records in a single transaction (seeding, CSV import)
+    
+    Args:
+        patients: List of (name_encrypted, contact_encrypted, diagnosis_encrypted) tuples
+        user_id: ID of user adding the records
+        role: Role of user adding the records
         
-        return True
-    except Exception as e:
-        print(f"Error adding patient: {e}")
+    Returns:
+        True if successful, False otherwise
+    """
+    try:
+        with get_connection_pool().checkout() as conn:
+            with conn:
+                cursor = conn.cursor()
+                
+                cursor.executemany(_SQL_INSERT_PATIENT, patients)
+                
+                # Log the action in the same transaction
+                _log_action_inline(cursor, user_id, role, "ADD_PATIENT", f"Bulk added {len(patients)} patients")
+            
+            get_all_patients_cached.clear()
+            
+            return True
+    except sqlite3.Error:
+        logger.exception("Error adding patients")
         return False
 
 
@@ -158,24 +498,33 @@ def get_all_patients() -> List[Dict]:
         List of patient dictionaries with encrypted data
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT patient_id, name, contact, diagnosis, date_added
-            FROM patients
-            ORDER BY patient_id DESC
-        """)
-        
-        patients = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return patients
-    except Exception as e:
-        print(f"Error fetching patients: {e}")
+        with get_connection_pool().checkout() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(_SQL_GET_ALL_PATIENTS)
+            
+            patients = _rows_as_dicts(cursor)
+            
+            return patients
+    except sqlite3.Error:
+        logger.exception("Error fetching patients")
         return []
 
 
+@st.cache_data(ttl=30, show_spinner=False)
+def get_all_patients_cached() -> List[Dict]:
+    """
+    Get all patient records (encrypted), cached across Streamlit reruns
+    
+    The cache is cleared by add_patient, update_patient and delete_patient,
+    and otherwise expires after 30 seconds.
+    
+    Returns:
+        List of patient dictionaries with encrypted data
+    """
+    return get_all_patients()
+
+
 def get_patient_by_id(patient_id: int) -> Optional[Dict]:
     """
     Get patient record by ID
@@ -187,23 +536,16 @@ def get_patient_by_id(patient_id: int) -> Optional[Dict]:
         Patient dictionary or None if not found
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT patient_id, name, contact, diagnosis, date_added
-            FROM patients
-            WHERE patient_id = ?
-        """, (patient_id,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return dict(result)
-        return None
-    except Exception as e:
-        print(f"Error fetching patient: {e}")
+        with get_connection_pool().checkout() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(_SQL_GET_PATIENT_BY_ID, (patient_id,))
+            
+            patients = _rows_as_dicts(cursor)
+            
+            return patients[0] if patients else None
+    except sqlite3.Error:
+        logger.exception("Error fetching patient")
         return None
 
 
@@ -224,24 +566,20 @@ def update_patient(patient_id: int, name_encrypted: str, contact_encrypted: str,
         True if successful, False otherwise
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE patients
-            SET name = ?, contact = ?, diagnosis = ?
-            WHERE patient_id = ?
-        """, (name_encrypted, contact_encrypted, diagnosis_encrypted, patient_id))
-        
-        conn.commit()
-        conn.close()
-        
-        # Log the action
-        log_action(user_id, role, "UPDATE_PATIENT", f"Updated patient ID: {patient_id}")
-        
-        return True
-    except Exception as e:
-        print(f"Error updating patient: {e}")
+        with get_connection_pool().checkout() as conn:
+            with conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(_SQL_UPDATE_PATIENT, (name_encrypted, contact_encrypted, diagnosis_encrypted, patient_id))
+                
+                # Log the action in the same transaction
+                _log_action_inline(cursor, user_id, role, "UPDATE_PATIENT", f"Updated patient ID: {patient_id}")
+            
+            get_all_patients_cached.clear()
+            
+            return True
+    except sqlite3.Error:
+        logger.exception("Error updating patient")
         return False
 
 
@@ -258,41 +596,75 @@ def delete_patient(patient_id: int, user_id: int, role: str) -> bool:
         True if successful, False otherwise
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("DELETE FROM patients WHERE patient_id = ?", (patient_id,))
-        
-        conn.commit()
-        conn.close()
-        
-        # Log the action
-        log_action(user_id, role, "DELETE_PATIENT", f"Deleted patient ID: {patient_id}")
-        
-        return True
-    except Exception as e:
-        print(f"Error deleting patient: {e}")
+        with get_connection_pool().checkout() as conn:
+            with conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(_SQL_DELETE_PATIENT, (patient_id,))
+                
+                # Log the action in the same transaction
+                _log_action_inline(cursor, user_id, role, "DELETE_PATIENT", f"Deleted patient ID: {patient_id}")
+            
+            get_all_patients_cached.clear()
+            
+            return True
+    except sqlite3.Error:
+        logger.exception("Error deleting patient")
         return False
 
 
 def get_patient_count() -> int:
     """Get total number of patients"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) as count FROM patients")
-        result = cursor.fetchone()
-        conn.close()
-        
-        return result['count'] if result else 0
-    except Exception as e:
-        print(f"Error counting patients: {e}")
+        with get_connection_pool().checkout() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(_SQL_COUNT_PATIENTS)
+            result = cursor.fetchone()
+            
+            return result[0] if result else 0
+    except sqlite3.Error:
+        logger.exception("Error counting patients")
         return 0
 
 
 # ==================== LOG FUNCTIONS ====================
 
+def iter_logs(limit: int = 100, batch_size: int = 500) -> Iterator[Dict]:
+    """
+    Stream audit logs (admin only), newest first
+    
+    Rows are fetched batch_size at a time and yielded as dictionaries, so
+    large pulls never hold the whole result twice. The pooled connection is
+    held until the generator is exhausted or closed.
+    
+    Args:
+        limit: Maximum number of logs to retrieve
+        batch_size: Number of rows fetched from SQLite per round trip
+        
+    Yields:
+        Log dictionaries
+    """
+    flush_audit_log()
+    
+    try:
+        with get_connection_pool().checkout() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            
+            cursor.execute(_SQL_GET_ALL_LOGS, (limit,))
+            columns = [column[0] for column in cursor.description]
+            
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(zip(columns, row))
+    except sqlite3.Error:
+        logger.exception("Error fetching logs")
+
+
 def get_all_logs(limit: int = 100) -> List[Dict]:
     """
     Get audit logs (admin only)
@@ -303,25 +675,7 @@ def get_all_logs(limit: int = 100) -> List[Dict]:
     Returns:
         List of log dictionaries
     """
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT l.log_id, l.user_id, u.username, l.role, l.action, l.timestamp, l.details
-            FROM logs l
-            LEFT JOIN users u ON l.user_id = u.user_id
-            ORDER BY l.timestamp DESC
-            LIMIT ?
-        """, (limit,))
-        
-        logs = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return logs
-    except Exception as e:
-        print(f"Error fetching logs: {e}")
-        return []
+    return list(iter_logs(limit))
 
 
 def get_logs_by_user(user_id: int, limit: int = 50) -> List[Dict]:
@@ -335,24 +689,19 @@ def get_logs_by_user(user_id: int, limit: int = 50) -> List[Dict]:
     Returns:
         List of log dictionaries
     """
+    flush_audit_log()
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT log_id, user_id, role, action, timestamp, details
-            FROM logs
-            WHERE user_id = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        """, (user_id, limit))
-        
-        logs = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return logs
-    except Exception as e:
-        print(f"Error fetching user logs: {e}")
+        with get_connection_pool().checkout() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(_SQL_GET_LOGS_BY_USER, (user_id, limit))
+            
+            logs = _rows_as_dicts(cursor)
+            
+            return logs
+    except sqlite3.Error:
+        logger.exception("Error fetching user logs")
         return []
 
 
@@ -367,25 +716,19 @@ def get_logs_by_action(action: str, limit: int = 50) -> List[Dict]:
     Returns:
         List of log dictionaries
     """
+    flush_audit_log()
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT l.log_id, l.user_id, u.username, l.role, l.action, l.timestamp, l.details
-            FROM logs l
-            LEFT JOIN users u ON l.user_id = u.user_id
-            WHERE l.action = ?
-            ORDER BY l.timestamp DESC
-            LIMIT ?
-        """, (action, limit))
-        
-        logs = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return logs
-    except Exception as e:
-        print(f"Error fetching logs by action: {e}")
+        with get_connection_pool().checkout() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(_SQL_GET_LOGS_BY_ACTION, (action, limit))
+            
+            logs = _rows_as_dicts(cursor)
+            
+            return logs
+    except sqlite3.Error:
+        logger.exception("Error fetching logs by action")
         return []
 
 
@@ -396,42 +739,26 @@ def get_activity_stats() -> Dict:
     Returns:
         Dictionary with activity statistics
     """
+    flush_audit_log()
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Total logs
-        cursor.execute("SELECT COUNT(*) as count FROM logs")
-        total_logs = cursor.fetchone()['count']
-        
-        # Logs today
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM logs
-            WHERE DATE(timestamp) = DATE('now')
-        """)
-        logs_today = cursor.fetchone()['count']
-        
-        # Most active user
-        cursor.execute("""
-            SELECT u.username, COUNT(*) as count
-            FROM logs l
-            JOIN users u ON l.user_id = u.user_id
-            GROUP BY l.user_id
-            ORDER BY count DESC
-            LIMIT 1
-        """)
-        most_active = cursor.fetchone()
-        
-        conn.close()
-        
-        return {
-            'total_logs': total_logs,
-            'logs_today': logs_today,
-            'most_active_user': most_active['username'] if most_active else 'N/A',
-            'most_active_count': most_active['count'] if most_active else 0
-        }
-    except Exception as e:
-        print(f"Error fetching activity stats: {e}")
+        with get_connection_pool().checkout() as conn:
+            cursor = conn.cursor()
+            
+            # Totals and most active user in one statement; the LEFT JOIN keeps
+            # a row even when there are no logs yet. Time filters compare the
+            # raw timestamp against bounds so idx_logs_ts can be range-scanned
+            cursor.execute(_SQL_ACTIVITY_STATS)
+            stats = _fetchone_as_namedtuple(cursor)
+            
+            return {
+                'total_logs': stats.total_logs,
+                'logs_today': stats.logs_today,
+                'most_active_user': stats.username or 'N/A',
+                'most_active_count': stats.count or 0
+            }
+    except sqlite3.Error:
+        logger.exception("Error fetching activity stats")
         return {
             'total_logs': 0,
             'logs_today': 0,
@@ -450,22 +777,19 @@ def get_daily_activity(days: int = 7) -> List[Dict]:
     Returns:
         List of dictionaries with date and count
     """
+    flush_audit_log()
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT DATE(timestamp) as date, COUNT(*) as count
-            FROM logs
-            WHERE DATE(timestamp) >= DATE('now', '-' || ? || ' days')
-            GROUP BY DATE(timestamp)
-            ORDER BY date
-        """, (days,))
-        
-        activity = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return activity
-    except Exception as e:
-        print(f"Error fetching daily activity: {e}")
+        with get_connection_pool().checkout() as conn:
+            cursor = conn.cursor()
+            
+            # Bind the cutoff date instead of building it in SQL from `days`
+            cutoff = (datetime.now(timezone.utc).date() - timedelta(days=days)).isoformat()
+            cursor.execute(_SQL_DAILY_ACTIVITY, (cutoff,))
+            
+            activity = _rows_as_dicts(cursor)
+            
+            return activity
+    except sqlite3.Error:
+        logger.exception("Error fetching daily activity")
         return []
@@ -3,7 +3,18 @@ Database Initialization Script
 Creates the database schema and seeds initial data
 """
 import sqlite3
-from auth import hash_password
+
+# Bumped whenever tables or indexes change, so existing databases are upgraded
+SCHEMA_VERSION = 3
+
+# Demo users with precomputed Argon2id hashes (same parameters as
+# auth.get_password_hasher), so seeding never pays the KDF cost.
+# Passwords: admin123, doc123, rec123
+SEED_USERS = (
+    ('admin', '$argon2id$v=19$m=65536,t=3,p=4$bnujemg/pQFDhdOGokKDOQ$HCKxxWGwOoqI4OQ09lOjEYUALaZAzw7sdv3S5FFTr3Q', 'admin'),
+    ('dr_bob', '$argon2id$v=19$m=65536,t=3,p=4$ehdNfZU9f0KL0n2PLgZz+g$SjXm2lEigwDgPzekBkz7TsW1v3ruFX+pP4/eYLn+G7A', 'doctor'),
+    ('alice_recep', '$argon2id$v=19$m=65536,t=3,p=4$pv3/lcNWjR/qLvX5CyVgYw$CZvWGmmkBhkL9cuvAVZTQNUQOEpPrm2BByFYC596yOQ', 'receptionist')
+)
 
 
 def init_database():
@@ -48,6 +59,7 @@ def init_database():
         CREATE TABLE IF NOT EXISTS logs (
             log_id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
+            username TEXT,
             role TEXT NOT NULL,
             action TEXT NOT NULL,
             timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -55,6 +67,50 @@ def init_database():
             FOREIGN KEY (user_id) REFERENCES users(user_id)
         )
     """)
+    
+    # Databases created before logs.username existed: add and backfill it
+    cursor.execute("PRAGMA table_info(logs)")
+    if 'username' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE logs ADD COLUMN username TEXT")
+        cursor.execute("""
+            UPDATE logs
+            SET username = (SELECT username FROM users WHERE users.user_id = logs.user_id)
+        """)
+    conn.commit()
+    
+    # Create metadata table with a trigger-maintained patient counter, so
+    # counting patients is a point lookup instead of a table scan
+    print("📋 Creating app_meta table...")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS app_meta (
+            k TEXT PRIMARY KEY,
+            v INTEGER NOT NULL
+        )
+    """)
+    cursor.execute("""
+        INSERT OR IGNORE INTO app_meta (k, v)
+        SELECT 'patient_count', COUNT(*) FROM patients
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS patients_count_ai AFTER INSERT ON patients
+        BEGIN
+            UPDATE app_meta SET v = v + 1 WHERE k = 'patient_count';
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS patients_count_ad AFTER DELETE ON patients
+        BEGIN
+            UPDATE app_meta SET v = v - 1 WHERE k = 'patient_count';
+        END
+    """)
+    conn.commit()
+    
+    # Create indexes so log queries filtered by user/action and ordered by
+    # time are served by an index range scan instead of scan + sort
+    print("📋 Creating indexes...")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_user_ts ON logs(user_id, timestamp DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_action_ts ON logs(action, timestamp DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_ts ON logs(timestamp DESC)")
     conn.commit()
     
     # Check if users already exist
@@ -65,16 +121,10 @@ def init_database():
         print("👥 Seeding initial users...")
         
         # Seed users with hashed passwords
-        users = [
-            ('admin', hash_password('admin123'), 'admin'),
-            ('dr_bob', hash_password('doc123'), 'doctor'),
-            ('alice_recep', hash_password('rec123'), 'receptionist')
-        ]
-        
         cursor.executemany("""
             INSERT INTO users (username, password, role)
             VALUES (?, ?, ?)
-        """, users)
+        """, SEED_USERS)
         
         print("✅ Created 3 users:")
         print("   - admin (password: admin123) - Role: admin")
@@ -83,6 +133,10 @@ def init_database():
     else:
         print(f"ℹ️  Users table already contains {user_count} users")
     
+    # Refresh planner statistics and record the schema version
+    cursor.execute("ANALYZE")
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    
     # Commit changes and close
     conn.commit()
     conn.close()
@@ -0,0 +1,16 @@
+"""
+Shared test fixtures
+"""
+import pytest
+from argon2 import PasswordHasher
+
+# Cheapest valid Argon2id parameters; hashing correctness doesn't depend on cost
+_TEST_PASSWORD_HASHER = PasswordHasher(time_cost=1, memory_cost=8, parallelism=1)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def fast_password_hashing():
+    """Use a minimal-cost Argon2 hasher for the whole test run"""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr('auth.get_password_hasher', lambda: _TEST_PASSWORD_HASHER)
+        yield
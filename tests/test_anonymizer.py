@@ -4,8 +4,9 @@ Tests encryption, decryption, and data masking functions
 """
 import pytest
 from anonymizer import (
-    encrypt_data, decrypt_data, anonymize_name, anonymize_contact,
-    anonymize_diagnosis, prepare_patient_data_for_role
+    get_cipher, encrypt_data, encrypt_many, decrypt_data, decrypt_many, anonymize_name,
+    anonymize_contact, anonymize_diagnosis, prepare_patient_data_for_role,
+    prepare_patients_frame, ANONYMIZED_VIEW_CACHE_SIZE
 )
 import os
 from cryptography.fernet import Fernet
@@ -67,6 +68,42 @@ class TestEncryption:
         encrypted1 = encrypt_data("data1")
         encrypted2 = encrypt_data("data2")
         assert encrypted1 != encrypted2
+    
+    def test_cipher_reused_for_same_key(self, setup_test_key):
+        """Test that the cipher is built once and reused for the same key"""
+        assert get_cipher() is get_cipher()
+    
+    def test_cipher_follows_key_change(self, setup_test_key, monkeypatch):
+        """Test that a new key produces a new cipher"""
+        first = get_cipher()
+        monkeypatch.setenv('ENCRYPTION_KEY', Fernet.generate_key().decode())
+        assert get_cipher() is not first
+    
+    def test_decrypt_many_round_trip(self, setup_test_key):
+        """Test batch decryption preserves order and values"""
+        originals = ["John Doe", "123-456-7890", "Fever"]
+        encrypted = [encrypt_data(value) for value in originals]
+        assert decrypt_many(encrypted) == originals
+    
+    def test_encrypt_many_round_trip(self, setup_test_key):
+        """Test batch encryption keeps order and leaves empty values empty"""
+        originals = ["John Doe", "", "Fever"]
+        encrypted = encrypt_many(originals)
+        assert encrypted[1] == ""
+        assert [decrypt_data(value) for value in encrypted] == originals
+    
+    def test_decrypt_many_handles_empty_and_invalid(self, setup_test_key):
+        """Test batch decryption of empty and corrupted values"""
+        result = decrypt_many(["", "not-a-token", encrypt_data("ok")])
+        assert result == ["", "[Decryption Error]", "ok"]
+    
+    def test_decrypt_many_parallel_preserves_order(self, setup_test_key, monkeypatch):
+        """Test that thread-pooled batch decryption keeps input order"""
+        monkeypatch.setattr('anonymizer.PARALLEL_DECRYPT_THRESHOLD', 4)
+        monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+        originals = [f"value {i}" for i in range(50)] + [""]
+        encrypted = [encrypt_data(value) for value in originals]
+        assert decrypt_many(encrypted) == originals
 
 
 class TestAnonymization:
@@ -128,11 +165,33 @@ class TestAnonymization:
             result = anonymize_diagnosis(diagnosis)
             assert result == "Injury/Trauma"
     
+    @pytest.mark.parametrize("diagnosis,expected", [
+        ("Diabetic neuropathy", "Metabolic Condition"),
+        ("Fractured wrist", "Injury/Trauma"),
+        ("Multiple injuries", "Injury/Trauma"),
+        ("Injured knee", "Injury/Trauma")
+    ])
+    def test_anonymize_diagnosis_word_forms(self, diagnosis, expected):
+        """Test that other forms of the category keywords are recognised"""
+        assert anonymize_diagnosis(diagnosis) == expected
+    
     def test_anonymize_diagnosis_general(self):
         """Test diagnosis anonymization for general conditions"""
         result = anonymize_diagnosis("Unknown condition")
         assert result == "General Medical Condition"
     
+    def test_anonymize_diagnosis_keeps_category_priority(self):
+        """Test that earlier categories win when several keywords match"""
+        result = anonymize_diagnosis("Cardiac stress after FEVER")
+        assert result == "Respiratory Condition"
+    
+    def test_anonymize_diagnosis_memoized(self):
+        """Test that repeated diagnoses are served from the cache"""
+        anonymize_diagnosis("Seasonal flu")
+        hits = anonymize_diagnosis.cache_info().hits
+        assert anonymize_diagnosis("Seasonal flu") == "Respiratory Condition"
+        assert anonymize_diagnosis.cache_info().hits == hits + 1
+    
     def test_anonymize_diagnosis_empty(self):
         """Test diagnosis anonymization with empty string"""
         result = anonymize_diagnosis("")
@@ -205,3 +264,64 @@ class TestRoleBasedDataPreparation:
         assert result['name'] == "[Restricted]"
         assert result['contact'] == "[Restricted]"
         assert result['diagnosis'] == "[Restricted]"
+    
+    @pytest.mark.parametrize("role", ['admin', 'doctor', 'receptionist', 'unknown'])
+    def test_prepare_patients_frame_matches_single_record(self, setup_test_key, role):
+        """Test that the DataFrame view matches per-record preparation"""
+        patients = [
+            {
+                'patient_id': patient_id,
+                'name': encrypt_data(name),
+                'contact': encrypt_data(contact),
+                'diagnosis': encrypt_data(diagnosis),
+                'date_added': '2025-01-01'
+            }
+            for patient_id, name, contact, diagnosis in [
+                (1, "John Doe", "123-456-7890", "Fever"),
+                (2, "Jane Roe", "555", "Broken arm fracture")
+            ]
+        ]
+        
+        result = prepare_patients_frame(patients, role)
+        
+        assert result.to_dict('records') == [prepare_patient_data_for_role(p, role) for p in patients]
+    
+    def test_prepare_patients_frame_reuses_anonymized_rows(self, setup_test_key, monkeypatch):
+        """Test that unchanged rows are not decrypted again for anonymized views"""
+        patient = {
+            'patient_id': 7,
+            'name': encrypt_data("John Doe"),
+            'contact': encrypt_data("123-456-7890"),
+            'diagnosis': encrypt_data("Fever"),
+            'date_added': '2025-01-01'
+        }
+        prepare_patients_frame([patient], 'doctor')
+        
+        def fail_decrypt(values):
+            raise AssertionError("row should be served from cache")
+        monkeypatch.setattr('anonymizer.decrypt_many', fail_decrypt)
+        
+        result = prepare_patients_frame([patient], 'doctor')
+        
+        assert result.loc[0, 'contact'] == "XXX-XXX-7890"
+        assert result.loc[0, 'diagnosis'] == "Respiratory Condition"
+    
+    def test_prepare_patients_frame_caches_more_rows_than_cache_size(self, setup_test_key, monkeypatch):
+        """Test that a render larger than the cache size is still served from cache the second time"""
+        count = ANONYMIZED_VIEW_CACHE_SIZE // 2 + 500
+        contacts = encrypt_many(["555-01%04d" % i for i in range(count)])
+        diagnoses = encrypt_many(["Fever"] * count)
+        patients = [
+            {'patient_id': i, 'name': "", 'contact': contact, 'diagnosis': diagnosis, 'date_added': '2025-01-01'}
+            for i, (contact, diagnosis) in enumerate(zip(contacts, diagnoses), start=10_000)
+        ]
+        prepare_patients_frame(patients, 'doctor')
+        
+        def fail_decrypt(values):
+            raise AssertionError("rows should be served from cache")
+        monkeypatch.setattr('anonymizer.decrypt_many', fail_decrypt)
+        
+        result = prepare_patients_frame(patients, 'doctor')
+        
+        assert result['contact'].iloc[-1] == "XXX-XXX-%04d" % (count - 1)
+        assert (result['diagnosis'] == "Respiratory Condition").all()
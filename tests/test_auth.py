@@ -2,14 +2,35 @@
 Unit Tests for Authentication Module
 Tests password hashing, verification, and session management
 """
+import hashlib
 import pytest
+from argon2 import PasswordHasher, extract_parameters
 from auth import (
-    hash_password, verify_password, login_user, logout_user,
-    is_authenticated, get_current_user
+    hash_password, verify_password, password_needs_rehash, login_user, logout_user,
+    is_authenticated, get_current_user, ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM
 )
 import streamlit as st
 
 
+class _SS(dict):
+    """Stand-in for Streamlit's SessionState (item and attribute access)"""
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+    __setattr__ = dict.__setitem__
+
+
+@pytest.fixture(autouse=True)
+def _session(monkeypatch):
+    """Patch st.session_state with an empty stub; tests seed it as needed"""
+    s = _SS()
+    monkeypatch.setattr(st, 'session_state', s, raising=False)
+    yield s
+    s.clear()
+
+
 class TestPasswordHashing:
     """Test password hashing functionality"""
     
@@ -18,12 +39,14 @@ class TestPasswordHashing:
         result = hash_password("test123")
         assert isinstance(result, str)
     
-    def test_hash_password_consistent(self):
-        """Test that same password produces same hash"""
+    def test_hash_password_salted(self):
+        """Test that the same password hashes differently each time (random salt)"""
         password = "test123"
         hash1 = hash_password(password)
         hash2 = hash_password(password)
-        assert hash1 == hash2
+        assert hash1 != hash2
+        assert verify_password(password, hash1) is True
+        assert verify_password(password, hash2) is True
     
     def test_hash_password_different_inputs(self):
         """Test that different passwords produce different hashes"""
@@ -31,10 +54,10 @@ class TestPasswordHashing:
         hash2 = hash_password("password2")
         assert hash1 != hash2
     
-    def test_hash_password_length(self):
-        """Test that SHA-256 hash is 64 characters (hex)"""
+    def test_hash_password_argon2_format(self):
+        """Test that hashes use the encoded Argon2id format"""
         result = hash_password("test")
-        assert len(result) == 64
+        assert result.startswith("$argon2id$")
     
     def test_verify_password_correct(self):
         """Test password verification with correct password"""
@@ -47,17 +70,54 @@ class TestPasswordHashing:
         password = "test123"
         hashed = hash_password(password)
         assert verify_password("wrong", hashed) is False
+    
+    def test_verify_password_legacy_sha256(self):
+        """Test that legacy SHA-256 hashes still verify"""
+        legacy = hashlib.sha256("test123".encode()).hexdigest()
+        assert verify_password("test123", legacy) is True
+        assert verify_password("wrong", legacy) is False
+    
+    def test_password_needs_rehash(self):
+        """Test that legacy hashes need rehashing and current ones don't"""
+        assert password_needs_rehash(hashlib.sha256(b"test123").hexdigest()) is True
+        assert password_needs_rehash(hash_password("test123")) is False
+    
+    def test_password_needs_rehash_only_upgrades(self, monkeypatch):
+        """Test that weaker Argon2 hashes are upgraded and stronger ones are never downgraded"""
+        from init_db import SEED_USERS
+        
+        weak_hash = PasswordHasher(time_cost=1, memory_cost=8, parallelism=1).hash("test123")
+        monkeypatch.setattr('auth.get_password_hasher',
+                            lambda: PasswordHasher(time_cost=2, memory_cost=16, parallelism=1))
+        
+        assert password_needs_rehash(weak_hash) is True
+        # Production-cost seed hash is stronger than the current hasher
+        assert password_needs_rehash(SEED_USERS[0][1]) is False
+    
+    def test_verify_password_malformed_hash(self):
+        """Test that a malformed stored hash is rejected"""
+        assert verify_password("test123", "not-a-hash") is False
+    
+    @pytest.mark.parametrize("index,password", [(0, "admin123"), (1, "doc123"), (2, "rec123")])
+    def test_seed_user_hashes_match_demo_passwords(self, index, password):
+        """Test that the precomputed seed hashes verify and use the production parameters"""
+        from init_db import SEED_USERS
+        
+        stored_hash = SEED_USERS[index][1]
+        assert verify_password(password, stored_hash) is True
+        
+        # Tests run with a cheaper hasher, so compare with the production cost
+        params = extract_parameters(stored_hash)
+        assert (params.time_cost, params.memory_cost, params.parallelism) == (
+            ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM
+        )
 
 
 class TestSessionManagement:
     """Test session state management"""
     
-    def test_login_user_sets_session_state(self, mocker):
+    def test_login_user_sets_session_state(self, _session):
         """Test that login_user sets session state correctly"""
-        # Mock streamlit session_state
-        mock_session = {}
-        mocker.patch.object(st, 'session_state', mock_session)
-        
         login_user(1, "testuser", "admin")
         
         assert st.session_state['authenticated'] is True
@@ -65,44 +125,44 @@ class TestSessionManagement:
         assert st.session_state['username'] == "testuser"
         assert st.session_state['role'] == "admin"
     
-    def test_logout_user_clears_session(self, mocker):
-        """Test that logout_user clears session state"""
-        # Mock streamlit session_state
-        mock_session = {
-            'authenticated': True,
-            'user_id': 1,
-            'username': 'test',
-            'role': 'admin'
-        }
-        mocker.patch.object(st, 'session_state', mock_session)
+    def test_logout_user_clears_session(self, _session):
+        """Test that logout_user clears session state back to the defaults"""
+        _session.update(
+            authenticated=True,
+            user_id=1,
+            username='test',
+            role='admin',
+            selected_page='Patients'
+        )
         
         logout_user()
         
-        assert len(st.session_state) == 0
+        assert st.session_state == {
+            'authenticated': False,
+            'user_id': None,
+            'username': None,
+            'role': None
+        }
+        assert is_authenticated() is False
     
-    def test_is_authenticated_true(self, mocker):
+    def test_is_authenticated_true(self, _session):
         """Test is_authenticated returns True when authenticated"""
-        mock_session = {'authenticated': True}
-        mocker.patch.object(st, 'session_state', mock_session)
+        _session['authenticated'] = True
         
         assert is_authenticated() is True
     
-    def test_is_authenticated_false(self, mocker):
+    def test_is_authenticated_false(self, _session):
         """Test is_authenticated returns False when not authenticated"""
-        mock_session = {}
-        mocker.patch.object(st, 'session_state', mock_session)
-        
         assert is_authenticated() is False
     
-    def test_get_current_user_authenticated(self, mocker):
+    def test_get_current_user_authenticated(self, _session):
         """Test get_current_user returns user info when authenticated"""
-        mock_session = {
-            'authenticated': True,
-            'user_id': 1,
-            'username': 'testuser',
-            'role': 'admin'
-        }
-        mocker.patch.object(st, 'session_state', mock_session)
+        _session.update(
+            authenticated=True,
+            user_id=1,
+            username='testuser',
+            role='admin'
+        )
         
         user_id, username, role = get_current_user()
         
@@ -110,11 +170,8 @@ class TestSessionManagement:
         assert username == 'testuser'
         assert role == 'admin'
     
-    def test_get_current_user_not_authenticated(self, mocker):
+    def test_get_current_user_not_authenticated(self, _session):
         """Test get_current_user returns None values when not authenticated"""
-        mock_session = {}
-        mocker.patch.object(st, 'session_state', mock_session)
-        
         user_id, username, role = get_current_user()
         
         assert user_id is None
@@ -2,148 +2,285 @@
 Unit Tests for Database Module
 Tests database operations, logging, and data integrity
 """
+import functools
+import hashlib
 import pytest
 import sqlite3
-import os
+import threading
 from database import (
-    get_db_connection, log_action, authenticate_user, add_patient,
-    get_all_patients, get_patient_by_id, update_patient, delete_patient,
-    get_patient_count, get_all_logs
+    ConnectionPool, get_db_connection, log_action, authenticate_user, add_patient, bulk_add_patients,
+    get_all_patients, get_all_patients_cached, get_patient_by_id, update_patient, delete_patient,
+    get_patient_count, get_all_logs, iter_logs, get_activity_stats, get_daily_activity,
+    flush_audit_log
 )
-from auth import hash_password
+from auth import hash_password, verify_password
 
+pytestmark = pytest.mark.db
 
-@pytest.fixture
-def test_db():
-    """Create a test database"""
-    # Use test database
-    test_db_path = 'test_hospital.db'
+
+# Test schema, mirroring init_db.py
+_SCHEMA_SQL = """
+    CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        role TEXT NOT NULL
+    );
     
-    # Remove if exists
-    if os.path.exists(test_db_path):
-        os.remove(test_db_path)
+    CREATE TABLE patients (
+        patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        contact TEXT NOT NULL,
+        diagnosis TEXT NOT NULL,
+        date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
     
-    # Create test database
-    conn = sqlite3.connect(test_db_path)
-    cursor = conn.cursor()
+    CREATE TABLE logs (
+        log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        role TEXT NOT NULL,
+        action TEXT NOT NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        details TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    );
     
-    # Create tables
-    cursor.execute("""
-        CREATE TABLE users (
-            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL
-        )
-    """)
+    CREATE TABLE app_meta (
+        k TEXT PRIMARY KEY,
+        v INTEGER NOT NULL
+    );
+    INSERT INTO app_meta (k, v) VALUES ('patient_count', 0);
     
-    cursor.execute("""
-        CREATE TABLE patients (
-            patient_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            contact TEXT NOT NULL,
-            diagnosis TEXT NOT NULL,
-            date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    CREATE TRIGGER patients_count_ai AFTER INSERT ON patients
+    BEGIN
+        UPDATE app_meta SET v = v + 1 WHERE k = 'patient_count';
+    END;
     
-    cursor.execute("""
-        CREATE TABLE logs (
-            log_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            role TEXT NOT NULL,
-            action TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            details TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(user_id)
-        )
-    """)
+    CREATE TRIGGER patients_count_ad AFTER DELETE ON patients
+    BEGIN
+        UPDATE app_meta SET v = v - 1 WHERE k = 'patient_count';
+    END;
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def _h(password):
+    """Hash each test password once; Argon2 is deliberately slow"""
+    return hash_password(password)
+
+
+@pytest.fixture(scope="session")
+def test_db(worker_id):
+    """Create the test database once per session (one per xdist worker)"""
+    # Shared-cache in-memory database; it lives as long as a connection to
+    # it is open, so this one stays open for the whole session
+    test_db_path = f'file:hospital_test_{worker_id}?mode=memory&cache=shared'
+    
+    # Create test database
+    conn = sqlite3.connect(test_db_path, uri=True)
+    cursor = conn.cursor()
+    
+    # Create tables in one script
+    cursor.executescript(_SCHEMA_SQL)
     
     # Seed test user
     cursor.execute("""
         INSERT INTO users (username, password, role)
         VALUES (?, ?, ?)
-    """, ('testuser', hash_password('testpass'), 'admin'))
+    """, ('testuser', _h('testpass'), 'admin'))
     
     conn.commit()
-    conn.close()
     
     yield test_db_path
     
-    # Cleanup
-    if os.path.exists(test_db_path):
-        os.remove(test_db_path)
+    conn.close()
+
+
+class _NonClosing:
+    """
+    Proxy for the per-test connection that keeps the test transaction open
+    
+    close() and commit() are no-ops, and `with conn:` blocks run inside a
+    savepoint, so code under test keeps its transaction semantics while
+    everything it writes is rolled back when the test ends.
+    """
+    
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = threading.RLock()
+    
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+    
+    def __enter__(self):
+        # The audit log writer thread shares this connection
+        self._lock.acquire()
+        self._conn.execute("SAVEPOINT test_block")
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is not None:
+                self._conn.execute("ROLLBACK TO test_block")
+            self._conn.execute("RELEASE test_block")
+        finally:
+            self._lock.release()
+        return False
+    
+    def commit(self):
+        pass
+    
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope="session")
+def session_conn(test_db):
+    """One configured connection to the test database, shared by all tests"""
+    conn = sqlite3.connect(test_db, uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    # The database is in memory, so there is no fsync for WAL or
+    # synchronous=NORMAL to save; only keep sort/temp tables off disk too
+    conn.execute("PRAGMA temp_store=MEMORY")
+    
+    yield conn
+    
+    conn.close()
+
+
+@pytest.fixture
+def db_conn(session_conn):
+    """Connection to the test database whose changes are rolled back after the test"""
+    session_conn.execute("BEGIN")
+    
+    yield _NonClosing(session_conn)
+    
+    session_conn.rollback()
+
+
+@pytest.fixture(autouse=True)
+def patch_db(db_conn, monkeypatch):
+    """Route every database call made by a test through its db_conn"""
+    pool = ConnectionPool(lambda: db_conn)
+    monkeypatch.setattr('database.get_connection_pool', lambda: pool)
+    
+    yield
+    
+    # Write queued audit rows into db_conn before the patch is undone (and
+    # before db_conn rolls back), so they never reach ./hospital.db
+    flush_audit_log()
+
+
+@pytest.fixture
+def seed_patients(db_conn):
+    """
+    Insert (name, contact, diagnosis) rows straight into the test database
+    
+    All rows go in with one executemany inside one transaction, for tests
+    that only need patients to exist rather than exercising add_patient.
+    """
+    def seed(rows):
+        with db_conn:
+            db_conn.executemany("""
+                INSERT INTO patients (name, contact, diagnosis)
+                VALUES (?, ?, ?)
+            """, rows)
+    
+    return seed
 
 
 class TestDatabaseConnection:
     """Test database connection"""
     
-    def test_get_db_connection_returns_connection(self):
+    def test_get_db_connection_returns_connection(self, tmp_path, monkeypatch):
         """Test that get_db_connection returns a connection object"""
+        # get_db_connection opens ./hospital.db; keep it in a pytest-managed directory
+        monkeypatch.chdir(tmp_path)
+        
         conn = get_db_connection()
         assert conn is not None
         assert isinstance(conn, sqlite3.Connection)
         conn.close()
+    
+    def test_connection_pool_reuses_connections(self, test_db):
+        """Test that the pool reuses returned connections and never shares a busy one"""
+        opened = []
+        
+        def mock_connection():
+            conn = sqlite3.connect(test_db, uri=True)
+            opened.append(conn)
+            return conn
+        
+        pool = ConnectionPool(mock_connection)
+        
+        try:
+            with pool.checkout() as first:
+                with pool.checkout() as second:
+                    assert first is not second
+            
+            with pool.checkout() as conn:
+                assert conn in (first, second)
+            
+            assert len(opened) == 2
+        finally:
+            for conn in opened:
+                conn.close()
 
 
 class TestAuthentication:
     """Test user authentication"""
     
-    def test_authenticate_user_valid_credentials(self, test_db, monkeypatch):
+    def test_authenticate_user_valid_credentials(self):
         """Test authentication with valid credentials"""
-        # Patch database connection to use test database
-        def mock_connection():
-            conn = sqlite3.connect(test_db)
-            conn.row_factory = sqlite3.Row
-            return conn
-        
-        monkeypatch.setattr('database.get_db_connection', mock_connection)
-        
-        result = authenticate_user('testuser', hash_password('testpass'))
+        result = authenticate_user('testuser', 'testpass')
         
         assert result is not None
         assert result[1] == 'testuser'
         assert result[2] == 'admin'
     
-    def test_authenticate_user_invalid_credentials(self, test_db, monkeypatch):
-        """Test authentication with invalid credentials"""
-        def mock_connection():
-            conn = sqlite3.connect(test_db)
-            conn.row_factory = sqlite3.Row
-            return conn
+    def test_authenticate_user_upgrades_legacy_hash(self, db_conn):
+        """Test that a legacy SHA-256 hash is replaced with Argon2 on login"""
+        db_conn.execute("UPDATE users SET password = ? WHERE username = 'testuser'",
+                        (hashlib.sha256(b'testpass').hexdigest(),))
         
-        monkeypatch.setattr('database.get_db_connection', mock_connection)
+        assert authenticate_user('testuser', 'testpass') is not None
         
-        result = authenticate_user('testuser', hash_password('wrongpass'))
+        stored = db_conn.execute("SELECT password FROM users WHERE username = 'testuser'").fetchone()[0]
         
-        assert result is None
+        assert stored.startswith('$argon2id$')
+        assert authenticate_user('testuser', 'testpass') is not None
     
-    def test_authenticate_user_nonexistent_user(self, test_db, monkeypatch):
-        """Test authentication with nonexistent user"""
-        def mock_connection():
-            conn = sqlite3.connect(test_db)
-            conn.row_factory = sqlite3.Row
-            return conn
+    @pytest.mark.parametrize("username,password", [
+        ('testuser', 'wrongpass'),
+        ('nonexistent', 'pass'),
+        # SQL injection attempts must not bypass authentication
+        ("admin' OR '1'='1", 'password'),
+        ('testuser', "' OR '1'='1")
+    ], ids=['wrong_password', 'nonexistent_user', 'sql_injection_username', 'sql_injection_password'])
+    def test_authenticate_user_rejects(self, username, password):
+        """Test that invalid credentials are rejected"""
+        assert authenticate_user(username, password) is None
+    
+    def test_authenticate_user_unknown_user_still_verifies(self, monkeypatch):
+        """Test that an unknown username costs a password verify like a known one"""
+        calls = []
         
-        monkeypatch.setattr('database.get_db_connection', mock_connection)
+        def spy(password, stored_hash):
+            calls.append(password)
+            return verify_password(password, stored_hash)
         
-        result = authenticate_user('nonexistent', hash_password('pass'))
+        monkeypatch.setattr('database.verify_password', spy)
         
-        assert result is None
+        assert authenticate_user('nonexistent', 'pass') is None
+        assert calls == ['pass']
 
 
 class TestPatientOperations:
     """Test patient CRUD operations"""
     
-    def test_add_patient_success(self, test_db, monkeypatch):
+    def test_add_patient_success(self):
         """Test adding a patient successfully"""
-        def mock_connection():
-            conn = sqlite3.connect(test_db)
-            conn.row_factory = sqlite3.Row
-            return conn
-        
-        monkeypatch.setattr('database.get_db_connection', mock_connection)
-        
         result = add_patient(
             'encrypted_name',
             'encrypted_contact',
@@ -154,17 +291,25 @@ class TestPatientOperations:
         
         assert result is True
     
-    def test_get_all_patients(self, test_db, monkeypatch):
-        """Test retrieving all patients"""
-        def mock_connection():
-            conn = sqlite3.connect(test_db)
-            conn.row_factory = sqlite3.Row
-            return conn
+    def test_add_patient_logged_in_same_transaction(self, db_conn):
+        """Test that add_patient writes its audit row without the batched writer"""
+        add_patient('enc_name', 'enc_contact', 'enc_diagnosis', 1, 'admin')
         
-        monkeypatch.setattr('database.get_db_connection', mock_connection)
+        count = db_conn.execute("SELECT COUNT(*) FROM logs WHERE action = 'ADD_PATIENT'").fetchone()[0]
         
+        assert count == 1
+    
+    def test_bulk_add_patients(self):
+        """Test adding several patients in one transaction"""
+        rows = [(f'enc_name{i}', f'enc_contact{i}', f'enc_diagnosis{i}') for i in range(5)]
+        
+        assert bulk_add_patients(rows, 1, 'admin') is True
+        assert get_patient_count() == 5
+    
+    def test_get_all_patients(self, seed_patients):
+        """Test retrieving all patients"""
         # Add a patient first
-        add_patient('enc_name', 'enc_contact', 'enc_diagnosis', 1, 'admin')
+        seed_patients([('enc_name', 'enc_contact', 'enc_diagnosis')])
         
         patients = get_all_patients()
         
@@ -172,88 +317,71 @@ class TestPatientOperations:
         assert 'patient_id' in patients[0]
         assert 'name' in patients[0]
     
-    def test_get_patient_by_id(self, test_db, monkeypatch):
-        """Test retrieving patient by ID"""
-        def mock_connection():
-            conn = sqlite3.connect(test_db)
-            conn.row_factory = sqlite3.Row
-            return conn
+    def test_get_all_patients_cached_invalidated_on_write(self):
+        """Test that writes clear the cached patient list"""
+        get_all_patients_cached.clear()
         
-        monkeypatch.setattr('database.get_db_connection', mock_connection)
+        assert get_all_patients_cached() == []
         
-        # Add a patient
         add_patient('enc_name', 'enc_contact', 'enc_diagnosis', 1, 'admin')
         
+        assert len(get_all_patients_cached()) == 1
+    
+    def test_get_patient_by_id(self, seed_patients):
+        """Test retrieving patient by ID"""
+        # Add a patient
+        seed_patients([('enc_name', 'enc_contact', 'enc_diagnosis')])
+        
         # Get the patient
         patient = get_patient_by_id(1)
         
         assert patient is not None
         assert patient['patient_id'] == 1
     
-    def test_update_patient_success(self, test_db, monkeypatch):
+    def test_update_patient_success(self, seed_patients):
         """Test updating patient successfully"""
-        def mock_connection():
-            conn = sqlite3.connect(test_db)
-            conn.row_factory = sqlite3.Row
-            return conn
-        
-        monkeypatch.setattr('database.get_db_connection', mock_connection)
-        
         # Add a patient
-        add_patient('enc_name', 'enc_contact', 'enc_diagnosis', 1, 'admin')
+        seed_patients([('enc_name', 'enc_contact', 'enc_diagnosis')])
         
         # Update the patient
         result = update_patient(1, 'new_name', 'new_contact', 'new_diagnosis', 1, 'admin')
         
         assert result is True
     
-    def test_delete_patient_success(self, test_db, monkeypatch):
+    def test_delete_patient_success(self, seed_patients):
         """Test deleting patient successfully"""
-        def mock_connection():
-            conn = sqlite3.connect(test_db)
-            conn.row_factory = sqlite3.Row
-            return conn
-        
-        monkeypatch.setattr('database.get_db_connection', mock_connection)
-        
         # Add a patient
-        add_patient('enc_name', 'enc_contact', 'enc_diagnosis', 1, 'admin')
+        seed_patients([('enc_name', 'enc_contact', 'enc_diagnosis')])
         
         # Delete the patient
         result = delete_patient(1, 1, 'admin')
         
         assert result is True
     
-    def test_get_patient_count(self, test_db, monkeypatch):
+    def test_get_patient_count(self, seed_patients):
         """Test getting patient count"""
-        def mock_connection():
-            conn = sqlite3.connect(test_db)
-            conn.row_factory = sqlite3.Row
-            return conn
-        
-        monkeypatch.setattr('database.get_db_connection', mock_connection)
-        
         # Add patients
-        add_patient('enc_name1', 'enc_contact1', 'enc_diagnosis1', 1, 'admin')
-        add_patient('enc_name2', 'enc_contact2', 'enc_diagnosis2', 1, 'admin')
+        seed_patients([
+            ('enc_name1', 'enc_contact1', 'enc_diagnosis1'),
+            ('enc_name2', 'enc_contact2', 'enc_diagnosis2')
+        ])
         
         count = get_patient_count()
         
         assert count == 2
+        
+        # Counter follows deletes and bulk inserts too
+        delete_patient(get_all_patients()[0]['patient_id'], 1, 'admin')
+        bulk_add_patients([('n', 'c', 'd')] * 3, 1, 'admin')
+        
+        assert get_patient_count() == 4
 
 
 class TestLogging:
     """Test logging functionality"""
     
-    def test_log_action_success(self, test_db, monkeypatch):
+    def test_log_action_success(self):
         """Test that actions are logged successfully"""
-        def mock_connection():
-            conn = sqlite3.connect(test_db)
-            conn.row_factory = sqlite3.Row
-            return conn
-        
-        monkeypatch.setattr('database.get_db_connection', mock_connection)
-        
         # Log an action
         log_action(1, 'admin', 'TEST_ACTION', 'Test details')
         
@@ -263,15 +391,34 @@ class TestLogging:
         assert len(logs) > 0
         assert logs[0]['action'] == 'TEST_ACTION'
     
-    def test_get_all_logs(self, test_db, monkeypatch):
-        """Test retrieving all logs"""
-        def mock_connection():
-            conn = sqlite3.connect(test_db)
-            conn.row_factory = sqlite3.Row
-            return conn
+    def test_log_action_batched_until_flush(self, db_conn):
+        """Test that queued actions are written together on flush"""
+        for i in range(3):
+            log_action(1, 'admin', 'BATCH_ACTION', f'Details {i}')
+        flush_audit_log()
+        
+        count = db_conn.execute("SELECT COUNT(*) FROM logs WHERE action = 'BATCH_ACTION'").fetchone()[0]
+        
+        assert count == 3
+    
+    def test_failed_flush_is_retried(self, db_conn, monkeypatch):
+        """Test that rows from a failed flush are written by the next flush"""
+        query = "SELECT COUNT(*) FROM logs WHERE action = 'RETRY_ACTION'"
+        
+        with monkeypatch.context() as m:
+            # Make the batch insert fail once
+            m.setattr('database._SQL_INSERT_LOG', "INSERT INTO missing_table VALUES (?1, ?2, ?3, ?4, ?5)")
+            log_action(1, 'admin', 'RETRY_ACTION', 'Details')
+            flush_audit_log()
+            
+            assert db_conn.execute(query).fetchone()[0] == 0
         
-        monkeypatch.setattr('database.get_db_connection', mock_connection)
+        flush_audit_log()
         
+        assert db_conn.execute(query).fetchone()[0] == 1
+    
+    def test_get_all_logs(self):
+        """Test retrieving all logs"""
         # Create some logs
         log_action(1, 'admin', 'ACTION1', 'Details 1')
         log_action(1, 'admin', 'ACTION2', 'Details 2')
@@ -279,22 +426,52 @@ class TestLogging:
         logs = get_all_logs(10)
         
         assert len(logs) >= 2
-
-
-class TestSQLInjectionPrevention:
-    """Test SQL injection prevention"""
+        assert all(log['username'] == 'testuser' for log in logs)
     
-    def test_authenticate_with_sql_injection_attempt(self, test_db, monkeypatch):
-        """Test that SQL injection is prevented in authentication"""
-        def mock_connection():
-            conn = sqlite3.connect(test_db)
-            conn.row_factory = sqlite3.Row
-            return conn
+    def test_iter_logs_streams_in_batches(self):
+        """Test that iter_logs yields every row across several fetch batches"""
+        for i in range(5):
+            log_action(1, 'admin', f'ACTION{i}', 'Details')
+        
+        logs = iter_logs(10, batch_size=2)
+        
+        assert not isinstance(logs, list)
+        logs = list(logs)
+        assert len(logs) == 5
+        assert set(logs[0]) == {'log_id', 'user_id', 'username', 'role', 'action', 'timestamp', 'details'}
+    
+    def test_get_activity_stats(self):
+        """Test activity stats with and without logged actions"""
+        stats = get_activity_stats()
+        assert stats == {
+            'total_logs': 0,
+            'logs_today': 0,
+            'most_active_user': 'N/A',
+            'most_active_count': 0
+        }
+        
+        log_action(1, 'admin', 'ACTION1', 'Details 1')
+        log_action(1, 'admin', 'ACTION2', 'Details 2')
+        
+        stats = get_activity_stats()
+        assert stats['total_logs'] == 2
+        assert stats['logs_today'] == 2
+        assert stats['most_active_user'] == 'testuser'
+        assert stats['most_active_count'] == 2
+    
+    def test_get_daily_activity(self, db_conn):
+        """Test daily activity counts only logs inside the window"""
+        log_action(1, 'admin', 'ACTION1', 'Details 1')
+        log_action(1, 'admin', 'ACTION2', 'Details 2')
+        flush_audit_log()
         
-        monkeypatch.setattr('database.get_db_connection', mock_connection)
+        db_conn.execute("""
+            INSERT INTO logs (user_id, role, action, details, timestamp)
+            VALUES (1, 'admin', 'OLD_ACTION', '', '2000-01-01 12:00:00')
+        """)
         
-        # Attempt SQL injection
-        result = authenticate_user("admin' OR '1'='1", "password")
+        activity = get_daily_activity(7)
         
-        # Should return None, not bypass authentication
-        assert result is None
+        assert len(activity) == 1
+        assert activity[0]['count'] == 2
+        assert len(activity[0]['date']) == 10